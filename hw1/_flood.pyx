@@ -0,0 +1,74 @@
+# cython: boundscheck=False, wraparound=False, language_level=3
+"""
+Cython version of the percolation flood fill in roll_percolation.py. Build it in
+place with
+
+    cythonize -i _flood.pyx
+
+and roll_percolation.py will pick it up instead of the numba kernel.
+"""
+
+import numpy as np
+from libc.stdlib cimport malloc, free
+
+
+def flood(open_mask, wet, bint early_exit=False):
+    """
+    Pour water into the top row of a lattice and let it flow through the open sites.
+    open_mask is True at the open sites, and every site the water reaches is set to
+    True in wet, which is modified in place. Both arrays must be C-contiguous bool.
+    If early_exit is True, the flow stops as soon as water reaches the bottom row.
+
+    Returns True if water reaches the bottom row.
+    """
+    #memoryviews cannot hold numpy bools directly, so view them as bytes
+    cdef const unsigned char[:, ::1] grid = open_mask.view(np.uint8)
+    cdef unsigned char[:, ::1] out = wet.view(np.uint8)
+    cdef Py_ssize_t n = grid.shape[0]
+    cdef Py_ssize_t m = grid.shape[1]
+    cdef Py_ssize_t i, j, ni, nj, c, d
+    cdef Py_ssize_t sp = 0 #stack pointer
+    cdef bint percolated = False
+    cdef Py_ssize_t di[4]
+    cdef Py_ssize_t dj[4]
+    di[:] = [0, 0, -1, 1] #left, right, up, down
+    dj[:] = [-1, 1, 0, 0]
+
+    #each site is pushed at most once, as a flattened index i*m + j
+    cdef Py_ssize_t *stack = <Py_ssize_t *> malloc(n*m*sizeof(Py_ssize_t))
+    if stack == NULL and n*m > 0:
+        raise MemoryError()
+
+    try:
+        with nogil:
+            #puts water in every open cell of the top row
+            for c in range(m):
+                if grid[0, c]:
+                    out[0, c] = 1
+                    stack[sp] = c
+                    sp += 1
+                    if n == 1: #the top row is also the bottom row
+                        percolated = True
+            if percolated and early_exit:
+                sp = 0
+
+            #water flows from cells on the stack until there is nowhere left to go
+            while sp > 0:
+                sp -= 1
+                i = stack[sp] // m
+                j = stack[sp] % m
+                for d in range(4):
+                    ni = i + di[d]
+                    nj = j + dj[d]
+                    if 0 <= ni < n and 0 <= nj < m and grid[ni, nj] and not out[ni, nj]:
+                        out[ni, nj] = 1
+                        stack[sp] = ni*m + nj
+                        sp += 1
+                        if ni == n-1: #water reached the bottom row
+                            percolated = True
+                            if early_exit:
+                                sp = 0
+                                break
+    finally:
+        free(stack)
+    return percolated
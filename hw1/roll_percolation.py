@@ -1,3 +1,228 @@
+import numpy as np
+from joblib import Parallel, delayed
+from numba import njit, prange
+
+
+@njit(cache=True)
+def _flood_numba(open_mask, wet, early_exit=False):
+    """
+    Pour water into the top row of a lattice and let it flow through the open sites.
+    open_mask is True at the open sites, and every site the water reaches is set to
+    True in wet, which is modified in place. If early_exit is True, the flow stops as
+    soon as water reaches the bottom row.
+
+    The flow is tracked with a preallocated stack of (row, column) pairs, so the
+    whole loop compiles to native code.
+
+    Returns True if water reaches the bottom row.
+    """
+    n = open_mask.shape[0]
+    m = open_mask.shape[1]
+    stack = np.empty((n*m, 2), np.int32) #each site is pushed at most once
+    sp = 0 #stack pointer
+    percolated = False
+
+    #puts water in every open cell of the top row
+    for c in range(m):
+        if open_mask[0, c]:
+            wet[0, c] = True
+            stack[sp, 0] = 0
+            stack[sp, 1] = c
+            sp += 1
+            if n == 1: #the top row is also the bottom row
+                percolated = True
+                if early_exit:
+                    return True
+
+    #water flows from cells on the stack until there is nowhere left to go
+    while sp > 0:
+        sp -= 1
+        i = stack[sp, 0]
+        j = stack[sp, 1]
+        for di, dj in ((0, -1), (0, 1), (-1, 0), (1, 0)): #left, right, up, down
+            ni = i + di
+            nj = j + dj
+            if 0 <= ni < n and 0 <= nj < m and open_mask[ni, nj] and not wet[ni, nj]:
+                wet[ni, nj] = True
+                stack[sp, 0] = ni
+                stack[sp, 1] = nj
+                sp += 1
+                if ni == n-1: #water reached the bottom row
+                    percolated = True
+                    if early_exit:
+                        return True
+    return percolated
+
+
+try:
+    # Ahead-of-time compiled version of the same kernel, if it has been built with
+    # `cythonize -i _flood.pyx`. This avoids the JIT warmup in every new process. The
+    # extension sits next to this file, so it is imported relative to the package when
+    # this module is part of one (e.g. hw1.roll_percolation), and from sys.path
+    # otherwise (e.g. when run from inside hw1/)
+    if __package__:
+        from ._flood import flood as _flood
+    else:
+        from _flood import flood as _flood
+except ImportError:
+    _flood = _flood_numba
+
+
+@njit(parallel=True, boundscheck=False, cache=True)
+def _sweep_step(open_mask, wet, out):
+    """
+    One sweep of the percolation stencil: every open site next to a wet site in wet
+    becomes wet in out. The neighbor tests are fused into a single pass over the
+    lattice, so no shifted copies of wet are ever allocated, and the rows are
+    updated in parallel.
+
+    Returns True if any site became wet.
+    """
+    n = wet.shape[0]
+    m = wet.shape[1]
+    n_changed = 0
+    for i in prange(n):
+        for j in range(m):
+            w = wet[i, j]
+            if open_mask[i, j] and not w:
+                w = (
+                    (i > 0 and wet[i-1, j]) or (i < n-1 and wet[i+1, j])
+                    or (j > 0 and wet[i, j-1]) or (j < m-1 and wet[i, j+1])
+                )
+                if w:
+                    n_changed += 1
+            out[i, j] = w
+    return n_changed > 0
+
+
+def _sweep(open_mask, wet, early_exit=False):
+    """
+    Pour water into the top row of a lattice and let it spread one site per sweep
+    until the wet sites stop changing. Takes the same arguments as _flood, and wet is
+    modified in place.
+
+    The sweeps ping-pong between wet and a second buffer, so nothing is allocated
+    inside the loop.
+
+    Returns True if water reaches the bottom row.
+    """
+    wet[0] |= open_mask[0] #puts water in every open cell of the top row
+    buffers = (wet, np.empty_like(wet))
+    k = 0 #which buffer holds the current state
+    while _sweep_step(open_mask, buffers[k], buffers[1-k]):
+        k = 1 - k
+        if early_exit and buffers[k][-1].any():
+            break
+    if k == 1:
+        wet[:] = buffers[1]
+    return bool(wet[-1].any())
+
+
+def _pack_rows(mask):
+    """
+    Pack each row of a boolean lattice into little-endian uint64 words, so that
+    column j is bit j % 64 of word j // 64. Rows are padded with 0s up to a whole
+    number of words.
+    """
+    n, m = mask.shape
+    padded = np.zeros((n, -(-m // 64) * 64), dtype=bool)
+    padded[:, :m] = mask
+    return np.packbits(padded, axis=1, bitorder="little").view("<u8")
+
+
+@njit(cache=True)
+def _bitsweep_fill(open_bits, wet_bits, early_exit):
+    """
+    Spread water through a lattice stored as packed rows (see _pack_rows). wet_bits
+    is modified in place.
+
+    Each row is updated a word at a time: water arrives from the rows above and below
+    with a plain OR, then spreads sideways by shifting the words left and right,
+    carrying the bits that cross a word boundary, until the row stops changing.
+    Rows are updated in place, sweeping down the lattice and then back up, until a
+    full pass changes nothing.
+
+    Returns True if water reaches the bottom row.
+    """
+    n = wet_bits.shape[0]
+    n_words = wet_bits.shape[1]
+    one = np.uint64(1)
+    top = np.uint64(63)
+    row = np.empty(n_words, np.uint64)
+    changed = True
+    while changed:
+        changed = False
+        for sweep in range(2):
+            for k in range(n):
+                i = k if sweep == 0 else n - 1 - k #down, then back up
+                for w in range(n_words):
+                    row[w] = wet_bits[i, w]
+                    if i > 0:
+                        row[w] |= wet_bits[i-1, w]
+                    if i < n-1:
+                        row[w] |= wet_bits[i+1, w]
+                    row[w] &= open_bits[i, w]
+
+                #spread sideways within the row until it stops changing
+                spreading = True
+                while spreading:
+                    spreading = False
+                    prev_word = np.uint64(0) #the word to the left, before this pass
+                    for w in range(n_words):
+                        x = row[w]
+                        spread = x | (x << one) | (x >> one) | (prev_word >> top)
+                        if w < n_words - 1:
+                            spread |= row[w+1] << top
+                        spread &= open_bits[i, w]
+                        prev_word = x
+                        if spread != x:
+                            row[w] = spread
+                            spreading = True
+
+                for w in range(n_words):
+                    if row[w] != wet_bits[i, w]:
+                        wet_bits[i, w] = row[w]
+                        changed = True
+
+                if early_exit and i == n-1:
+                    for w in range(n_words):
+                        if wet_bits[i, w] != 0:
+                            return True
+
+    for w in range(n_words):
+        if wet_bits[n-1, w] != 0:
+            return True
+    return False
+
+
+def _bitsweep(open_mask, wet, early_exit=False):
+    """
+    Same as _sweep, but on lattices packed 64 sites to a word, which moves 8 times
+    fewer bytes than the boolean masks. This pays off for very large lattices, where
+    the masks no longer fit in cache.
+    """
+    wet[0] |= open_mask[0] #puts water in every open cell of the top row
+    open_bits = _pack_rows(open_mask)
+    wet_bits = _pack_rows(wet)
+    percolates = _bitsweep_fill(open_bits, wet_bits, early_exit)
+    m = wet.shape[1]
+    wet[:] = np.unpackbits(wet_bits.view(np.uint8), axis=1, bitorder="little")[:, :m]
+    return bool(percolates)
+
+
+def _one_trial(cls, n, p, seed):
+    """
+    Run a single percolation simulation of class cls for
+    PercolationSimulation.run_ensemble. Only the summary statistics are returned, so
+    that the lattices never need to be sent back from the worker processes.
+
+    Returns a tuple of whether the lattice percolates, and the number of filled sites.
+    """
+    model = cls(n=n, p=p, random_state=seed)
+    percolates = model.percolate()
+    return percolates, int(np.sum(model.grid_filled == 2))
+
+
 class PercolationSimulation:
     """
     A simulation of a 2D directed percolation problem. Given a 2D lattice, blocked sites
@@ -29,8 +254,7 @@ class PercolationSimulation:
             random_state (int): random seed for the random number generator
         random_state (int): random seed for numpy's random number generator. Used to 
             ensure reproducibility across random simulations. The default value of None
-            will use the current state of the random number generator without resetting
-            it.
+            will draw a fresh seed from the operating system.
     """
 
     def __init__(self, n=100, p=0.5, grid=None, random_state=None):
@@ -42,37 +266,42 @@ class PercolationSimulation:
             p (float): probability of a site being blocked in the randomly-sampled lattice
             random_state (int): random seed for numpy's random number generator. Used to
                 ensure reproducibility across random simulations. The default value of None
-                will use the current state of the random number generator without resetting
-                it.
+                will draw a fresh seed from the operating system.
         """
 
         self.random_state = random_state #for storage
-        np.random.seed(self.random_state) #the random seed
 
         # Initialize a random grid if one is not provided. Otherwise, use the provided
         # grid.
         if grid is None:
             self.n = n
             self.p = p
-            self.grid = np.zeros((n, n))
             self._initialize_grid()
         else:
-            assert len(np.unique(np.ravel(grid))) <= 2, "Grid must only contain 0s and 1s"
-            self.grid = grid.astype(int)
+            assert np.all((grid == 0) | (grid == 1)), "Grid must only contain 0s and 1s"
+            if grid.dtype != np.int8:
+                grid = grid.astype(np.int8) #sites only take the values 0, 1, 2
+            self.grid = grid
             # override numbers if grid is provided
             self.n = grid.shape[0]
             self.p = 1 - np.mean(grid)
 
-        # The filled grid used in the percolation calculation. Initialize to the original
-        # grid. We technically don't need to copy the original grid if we want to save
-        # memory, but it makes the code easier to debug if this is a separate variable 
-        # from self.grid.
-        self.grid_filled = np.copy(self.grid)
+        # The percolation calculation works on two boolean masks: the open sites, which
+        # never change, and the sites filled with water. Keeping them separate means
+        # the open sites are never clobbered as water flows, and self.grid_filled is
+        # only assembled from them when it is read.
+        self._open = np.ascontiguousarray(self.grid == 1) #the Cython kernel needs C order
+        self._wet = np.zeros_like(self._open)
+
+    @property
+    def grid_filled(self):
+        """The lattice with the sites filled by water marked by a 2"""
+        return np.where(self._wet, 2, self.grid).astype(np.int8)
 
     def _initialize_grid(self):
         """
         Sample a random lattice for the percolation simulation. This method should
-        write new values to the self.grid and self.grid_filled attributes. Make sure
+        write new values to the self.grid attribute. Make sure
         to set the random seed inside this method.
 
         This is a helper function for the percolation algorithm, and so we denote it 
@@ -88,73 +317,74 @@ class PercolationSimulation:
         input/outputs because it's a public method
         """
 
-        for rind in range(self.n): #iterates over grid rows (slow)
-            for cind in range(self.n): #iterates over grid cols (fast)
-                #randomly assigns percolation walls according to probability p
-                if np.random.random() > self.p:
-                    self.grid[rind][cind] = 1 #0 is blocked, 1 is open
+        rng = np.random.default_rng(self.random_state) #the random seed
+
+        #randomly assigns percolation walls according to probability p in a single draw
+        self.grid = (rng.random((self.n, self.n)) > self.p).astype(np.int8) #0 is blocked, 1 is open
         
 
-    def _poll_neighbors(self, i, j):
+    def percolate(self, early_exit=False, method="flood"):
         """
-        Check whether there is a filled site adjacent to a site at coordinates i, j in 
-        self.grid_filled. Respects boundary conditions.
+        Initialize a random lattice and then run a percolation simulation. Report results
 
-        Returns True/False if the following cell is filled/blocked [Left,Right,Up,Down]
+        Args:
+            early_exit (bool): stop the simulation as soon as water reaches the bottom
+                row. This is faster when only the return value is needed, but then
+                self.grid_filled only holds the sites filled up to that point.
+            method (str): "flood" follows the water site by site, which only visits
+                the sites that get filled. "sweep" updates the whole lattice at once
+                until the water stops spreading, which parallelizes across cores but
+                takes one pass per step along the longest path the water follows.
+                "bitsweep" updates lattices packed 64 sites to a word, sweeping down
+                and back up so that water travels many rows per pass. It wins on
+                large, mostly open lattices (p well below the percolation threshold),
+                where the water fills most of the sites. Near or above the threshold,
+                or along long winding paths, "flood" is faster: bitsweep still scans
+                the whole lattice, and water only moves one site sideways per pass
+                over a row.
         """
 
-        output = [False,False,False,False] #whether the water can travel left, right, up, or down
-
-        if j != 0: #not on the left boundary
-            if self.grid_filled[i][j-1] == 1: #Left
-                output[0] = True
-        if j != self.n-1: #not on right boundary
-            if self.grid_filled[i][j+1] == 1: #Right
-                output[1] = True
-        if i != 0: #not on upper boundary
-            if self.grid_filled[i-1][j] == 1: #Up
-                output[2] = True
-        if i != self.n-1: #not on lower boundary
-            if self.grid_filled[i+1][j] == 1: #Down
-                output[3] = True
-
-        return output
-
-    
-    def _flow_recursive(self, i, j):
-        """
-        Only used if we opt for a recursive solution.
+        #starts from a dry lattice, so that repeated calls give the same answer
+        self._wet[:] = False
 
-        The recursive portion of the flow simulation. Notice how grid and grid_filled
-        are used to keep track of the global state, even as our recursive calls nest
-        deeper and deeper
-        """
+        if method == "flood":
+            percolates = _flood(self._open, self._wet, early_exit)
+        elif method == "sweep":
+            percolates = _sweep(self._open, self._wet, early_exit)
+        elif method == "bitsweep":
+            percolates = _bitsweep(self._open, self._wet, early_exit)
+        else:
+            raise ValueError("method must be 'flood', 'sweep' or 'bitsweep'")
 
-        movement = self._poll_neighbors(i,j) #has valid directions water can move (left,right,up,down)
+        #outputs if percolation completes or not
+        return bool(percolates)
 
-        if movement[0] == True: #Water can move left
-            self.grid_filled[i][j-1] = 2
-            self._flow_recursive(i,j-1)
-        if movement[1] == True: #Water can move right
-            self.grid_filled[i][j+1] = 2
-            self._flow_recursive(i,j+1)
-        if movement[2] == True: #Water can move up
-            self.grid_filled[i-1][j] = 2
-            self._flow_recursive(i-1,j)
-        if movement[3] == True: #Water can move down
-            self.grid_filled[i+1][j] = 2
-            self._flow_recursive(i+1,j)
+    @classmethod
+    def run_ensemble(cls, n, p, n_trials, n_jobs=-1, random_state=None):
+        """
+        Run many independent percolation simulations in parallel, as used to estimate
+        the percolation threshold. Each trial gets its own random lattice, seeded from
+        a single random number generator so that the whole ensemble is reproducible.
 
+        Args:
+            n (int): number of rows and columns in each lattice
+            p (float): probability of a site being blocked
+            n_trials (int): number of independent lattices to simulate
+            n_jobs (int): number of worker processes. The default value of -1 uses
+                every available core.
+            random_state (int): random seed for the ensemble
 
-    def percolate(self):
-        """
-        Initialize a random lattice and then run a percolation simulation. Report results
+        Returns:
+            percolates (np.array): whether each trial percolates
+            filled_sites (np.array): the number of sites filled with water in each trial
         """
+        rng = np.random.default_rng(random_state)
+        seeds = rng.integers(0, 2**31, n_trials)
 
-        for cind in range(self.n): #iterates over columns within top row
-            if self.grid[0][cind] == 1: #if starting cell is open
-                self.grid_filled[0][cind] = 2 #puts water in starting cell
-                self._flow_recursive(0,cind) #water flows
-        
-        #outputs if percolation completes or not
-        return 2 in self.grid_filled[-1]
\ No newline at end of file
+        #processes rather than threads, since most of each trial runs holding the GIL
+        results = Parallel(n_jobs=n_jobs, prefer="processes")(
+            delayed(_one_trial)(cls, n, p, seed) for seed in seeds
+        )
+        percolates = np.array([result[0] for result in results], dtype=bool)
+        filled_sites = np.array([result[1] for result in results], dtype=int)
+        return percolates, filled_sites
\ No newline at end of file
@@ -1,3 +1,76 @@
+import numpy as np
+from numba import njit
+
+
+@njit(cache=True)
+def _grow(buffer):
+    """Double the capacity of a (2, capacity) wave buffer, keeping its contents"""
+    grown = np.empty((2, 2*buffer.shape[1]), buffer.dtype)
+    grown[:, :buffer.shape[1]] = buffer
+    return grown
+
+
+@njit(cache=True)
+def _topple(padded, rows, cols, i, j):
+    """
+    Topple the avalanche caused by a grain added at site (i, j), repeating until the
+    whole pile is stable. padded is the grid surrounded by a one-cell halo, and is
+    modified in place.
+
+    The avalanche is processed in waves. Every site in a wave loses 4 grains, then
+    hands one grain to each neighbor, and the neighbors that become unstable form the
+    next wave. Waves are stored as parallel arrays of row and column indices: rows[w]
+    and cols[w] hold the current wave and rows[1-w] and cols[1-w] collect the next
+    one, so only the sites that take part in the avalanche are ever visited. Grains
+    handed to the halo are lost, so it is cleared once the pile is stable.
+
+    Returns the total number of topples in the avalanche, along with the rows and
+    cols buffers, which are reallocated with double the capacity if a wave outgrows
+    them.
+    """
+    n = padded.shape[0] - 2
+    m = padded.shape[1] - 2
+    w = 0 #which half of the buffers holds the current wave
+    size = 0
+    if padded[i, j] >= 4:
+        rows[w, 0] = i
+        cols[w, 0] = j
+        size = 1
+
+    n_topples = 0
+    while size > 0:
+        for k in range(size):
+            padded[rows[w, k], cols[w, k]] -= 4 #OH NO AN AVALEANCHE
+        n_topples += size
+
+        new_size = 0
+        for k in range(size):
+            r = rows[w, k]
+            c = cols[w, k]
+            for dr, dc in ((-1, 0), (1, 0), (0, -1), (0, 1)): #up, down, left, right
+                nr = r + dr
+                nc = c + dc
+                padded[nr, nc] += 1
+                #a site joins the next wave the moment it reaches 4 grains, so it is
+                #stored only once. The halo never topples
+                if padded[nr, nc] == 4 and 1 <= nr <= n and 1 <= nc <= m:
+                    if new_size == rows.shape[1]:
+                        rows = _grow(rows)
+                        cols = _grow(cols)
+                    rows[1-w, new_size] = nr
+                    cols[1-w, new_size] = nc
+                    new_size += 1
+        w = 1 - w
+        size = new_size
+
+    #grains that fell off the edge are lost
+    padded[0, :] = 0
+    padded[-1, :] = 0
+    padded[:, 0] = 0
+    padded[:, -1] = 0
+    return n_topples, rows, cols
+
+
 class AbelianSandpile:
     """
     An Abelian sandpile model simulation. The sandpile is initialized with a random
@@ -11,82 +84,58 @@ class AbelianSandpile:
     
     Parameters:
     n (int): The size of the grid
-    grid (np.ndarray): The grid of the sandpile
-    history (list): A list of the sandpile grids at each timestep
+    grid (np.ndarray): The grid of the sandpile, a view into the interior of _padded
+    history (list): A list of the sandpile grids, stored every history_stride timesteps
+    history_stride (int): The number of timesteps between stored grids. Storing every
+        grid costs an n*n copy per step, so larger strides save time and memory when
+        only the avalanche sizes are needed
+    avalanche_sizes (list): The number of topples caused by each timestep
     """
 
-    def __init__(self, n, random_state):
+    def __init__(self, n, random_state, history_stride=1):
         self.n = n
-        np.random.seed(random_state) # Set the random seed
-        self.grid = np.random.choice([0, 1, 2, 3], size=(n, n))
+        self.history_stride = history_stride
+        self._rng = np.random.default_rng(random_state) # Set the random seed
+        # The grid is stored with a one-cell halo so that toppling sites can hand out
+        # grains without checking the boundaries. A site never holds more than 7
+        # grains (3 plus one from each toppling neighbor), so int8 is wide enough
+        self._padded = np.zeros((n + 2, n + 2), dtype=np.int8)
+        self.grid = self._padded[1:-1, 1:-1]
+        self.grid[:] = self._rng.integers(0, 4, size=(n, n), dtype=np.int8)
         self.history =[self.grid.copy()]
+        self.avalanche_sizes = []
 
+        # Row and column indices of the sites in the current and next avalanche wave
+        self._rows = np.empty((2, 16), dtype=np.int32)
+        self._cols = np.empty((2, 16), dtype=np.int32)
 
-    def step(self):
+
+    def step(self, sand_drop=None):
         """
         Perform a single step of the sandpile model. Step corresponds a single sandgrain 
         addition and the consequent toppling it causes. 
+
+        Args:
+            sand_drop (np.ndarray): the row and column where the grain is added. The
+                default value of None picks a random site
+
+        Returns the number of topples caused by the added grain.
         """
-        sand_drop = np.random.choice(self.n,2) #picks random x,y coordinate to add grain
-
-        self.grid[sand_drop[0]][sand_drop[1]] += 1 #adds sand to sand_drop
-
-        ind_store = [sand_drop.copy()] #will store indices for tracking avalanche
-        while True:
-            start_len = len(ind_store) #number of points to check
-            if start_len == 0:
-                break
-
-            for coord in ind_store:
-                rind,cind = coord #defines row index and column index
-
-                if self.grid[rind][cind] < 4:
-                    continue #skip to next coordinate if no avalanche
-                    
-                self.grid[rind][cind] -= 4 #OH NO AN AVALEANCHE
-
-                #if-statements enforce boundary conditions
-                if rind != 0:
-                    self.grid[rind-1][cind] += 1
-                    ind_store.append([rind-1,cind])
-                if rind != self.n-1:
-                    self.grid[rind+1][cind] += 1
-                    ind_store.append([rind+1,cind])
-                if cind != 0:
-                    self.grid[rind][cind-1] += 1
-                    ind_store.append([rind,cind-1])
-                if cind != self.n-1:
-                    self.grid[rind][cind+1] += 1
-                    ind_store.append([rind,cind+1])
-                
-            del ind_store[:start_len] #only keeps new lattice sites to test
-
-        '''
-        #This will work, but is way too slow to reasonably perforn the n=100 test
-        while True: #runs through grid until the sand is stable
-            for rind in range(self.n): #iterates through lower rows originating at grain dropsite (slow)
-                for cind in range(self.n): #iterates through each column (fast)
-
-                    if self.grid[rind][cind] > 3: #finds event
-
-                        #Avalanche event
-                        self.grid[rind][cind] -= 4
-
-                        #if statements enforce boundary conditions
-                        if rind != 0:
-                            self.grid[rind-1][cind] += 1
-                        if rind != self.n-1:
-                            self.grid[rind+1][cind] += 1
-                        if cind != 0:
-                            self.grid[rind][cind-1] += 1
-                        if cind != self.n-1:
-                            self.grid[rind][cind+1] += 1
-
-            #Now finds maximum sand height.  If >3 then repeat process.  If <= 3 then complete.
-            row_max = [max(row) for row in self.grid[:]] #list of max values for each row
-            if max(row_max) <= 3:
-                break #exits while loop
-        '''
+        if sand_drop is None:
+            sand_drop = self._rng.integers(0, self.n, size=2) #picks random x,y coordinate to add grain
+
+        self.grid[sand_drop[0], sand_drop[1]] += 1 #adds sand to sand_drop
+
+        #negative indices count back from the end of the grid, as in numpy
+        row = sand_drop[0] % self.n
+        col = sand_drop[1] % self.n
+
+        #topples sites until the pile is stable
+        n_topples, self._rows, self._cols = _topple(
+            self._padded, self._rows, self._cols, row + 1, col + 1
+        )
+        return n_topples
+
 
     # we use this decorator for class methods that don't require any of the attributes 
     # stored in self. Notice how we don't pass self to the method
@@ -100,6 +149,9 @@ class AbelianSandpile:
         """
         Simulate the sandpile model for n_step steps.
         """
+        #draws every drop site for the whole simulation at once
+        sand_drops = self._rng.integers(0, self.n, size=(n_step, 2), dtype=np.int32)
         for ii in range(n_step):
-            self.step()
-            self.history.append(self.grid.copy())
\ No newline at end of file
+            self.avalanche_sizes.append(self.step(sand_drops[ii]))
+            if (ii + 1) % self.history_stride == 0:
+                self.history.append(self.grid.copy())
\ No newline at end of file
@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+from roll_percolation import PercolationSimulation
+
+
+@pytest.mark.parametrize("method", ["flood", "sweep", "bitsweep"])
+def test_percolate_repeated_calls(method):
+    """Calling percolate again on the same model gives the same result"""
+    model = PercolationSimulation(grid=np.ones((5, 5)))
+    assert [model.percolate(method=method) for _ in range(3)] == [True, True, True]
+
+    for seed in range(50):
+        model = PercolationSimulation(n=20, p=0.4, random_state=seed)
+        percolates = model.percolate(method=method)
+        grid_filled = model.grid_filled
+        assert model.percolate(early_exit=True, method=method) == percolates
+        assert model.percolate(method=method) == percolates
+        assert np.array_equal(model.grid_filled, grid_filled)
+
+
+def test_percolate_non_contiguous_grid():
+    """Fortran-ordered and transposed grids give the same result as C-ordered ones"""
+    grid = (np.random.default_rng(0).random((20, 20)) > 0.4).astype(np.int8)
+    expected = PercolationSimulation(grid=grid.T.copy()).percolate()
+    for layout in (grid.T, np.asfortranarray(grid.T)):
+        assert PercolationSimulation(grid=layout).percolate() == expected
+
+
+class AlwaysPercolates(PercolationSimulation):
+    def percolate(self, early_exit=False, method="flood"):
+        return True
+
+
+def test_run_ensemble_uses_subclass():
+    """run_ensemble runs the class it is called on, not always the base class"""
+    percolates, filled_sites = AlwaysPercolates.run_ensemble(10, 1.0, 4, n_jobs=1)
+    assert percolates.all()
+    assert (filled_sites == 0).all()
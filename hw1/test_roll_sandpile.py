@@ -0,0 +1,11 @@
+import numpy as np
+
+from roll_sandpile import AbelianSandpile
+
+
+def test_step_negative_drop():
+    """A grain dropped with negative indices still topples the pile until it is stable"""
+    model = AbelianSandpile(n=5, random_state=0)
+    model.grid[:] = 3
+    assert model.step(np.array([-1, 2])) > 0
+    assert model.grid.max() <= 3